@@ -0,0 +1,67 @@
+# Copyright (C) 2022 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import os
+import re
+import subprocess
+import tarfile
+from glob import glob
+from tempfile import TemporaryDirectory
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+RULES_DIR = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__)))), 'rules')
+
+def get_entrypoints(rules_dir):
+    entrypoints = []
+    for path in sorted(glob(os.path.join(rules_dir, '*.rego'))):
+        if path.endswith(('_test.rego', '_test.gen.rego')):
+            continue
+
+        with open(path) as f:
+            policy = f.read()
+
+        package = re.search(r'^package (\w+)', policy, re.MULTILINE).group(1)
+        for rule in ('allow', 'filter'):
+            if re.search(r'^(default )?{}\b'.format(rule), policy, re.MULTILINE):
+                entrypoints.append('{}/{}'.format(package, rule))
+
+    return entrypoints
+
+class Command(BaseCommand):
+    help = 'Build the WebAssembly version of IAM policies (see IAM_OPA_WASM_ENABLED)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--opa', default='opa',
+            help='Path to the OPA executable')
+
+    def handle(self, *args, **options):
+        with TemporaryDirectory() as tmp_dir:
+            bundle_path = os.path.join(tmp_dir, 'bundle.tar.gz')
+            cmd = [options['opa'], 'build', '-t', 'wasm', '-o', bundle_path,
+                '--ignore', '*_test.rego', '--ignore', '*_test.gen.rego']
+            for entrypoint in get_entrypoints(RULES_DIR):
+                cmd.extend(['-e', entrypoint])
+            cmd.append(RULES_DIR)
+
+            try:
+                subprocess.run(cmd, check=True)
+            except (OSError, subprocess.CalledProcessError) as ex:
+                raise CommandError('Cannot build the policy: {}'.format(str(ex)))
+
+            with tarfile.open(bundle_path) as bundle:
+                member = next((m for m in bundle.getmembers()
+                    if m.name.lstrip('/') == 'policy.wasm'), None)
+                if member is None:
+                    raise CommandError('The bundle does not contain policy.wasm')
+                policy = bundle.extractfile(member).read()
+
+        os.makedirs(os.path.dirname(settings.IAM_OPA_WASM_POLICY), exist_ok=True)
+        with open(settings.IAM_OPA_WASM_POLICY, 'wb') as f:
+            f.write(policy)
+
+        self.stdout.write('The policy has been written to {}'.format(
+            settings.IAM_OPA_WASM_POLICY))
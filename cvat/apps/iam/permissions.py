@@ -3,92 +3,329 @@
 # SPDX-License-Identifier: MIT
 
 from collections import namedtuple
-import operator
-from rest_framework.exceptions import ValidationError
-
-import requests
+import json
+import threading
+from rest_framework.exceptions import PermissionDenied, ValidationError
+
+import orjson
+import pybreaker
+import urllib3
+from cachetools import TTLCache
+from urllib3.util.retry import Retry
+from urllib3.util.timeout import Timeout
 from django.conf import settings
 from django.db.models import Q
 from rest_framework.permissions import BasePermission
 
 from cvat.apps.organizations.models import Membership, Organization
+from cvat.apps.engine.log import slogger
 from cvat.apps.engine.models import Project, Task, Job, Issue
 
+# All permission checks go to the same OPA server. Keep-alive connections
+# from the pool are reused between requests instead of opening a new
+# connection for every check. urllib3 is used directly because requests adds
+# noticeable overhead (sessions, cookies, prepared requests) to every call.
+_OPA_POOL = urllib3.PoolManager(num_pools=4, maxsize=64,
+    # Read errors aren't retried, so IAM_OPA_TIMEOUT bounds a stalled query
+    retries=Retry(total=2, connect=2, read=False, backoff_factor=0.1,
+        allowed_methods=False),
+    timeout=Timeout(connect=settings.IAM_OPA_TIMEOUT[0],
+        read=settings.IAM_OPA_TIMEOUT[1]))
+
+# If OPA doesn't respond, workers shouldn't wait for it one after another.
+# After several failures in a row queries are denied immediately for a while.
+_OPA_BREAKER = pybreaker.CircuitBreaker(
+    fail_max=settings.IAM_OPA_BREAKER_FAIL_MAX,
+    reset_timeout=settings.IAM_OPA_BREAKER_RESET_TIMEOUT)
+
+def _dump_json(obj, sort_keys=False):
+    # orjson doesn't support integers out of the 64-bit range, but they can
+    # come from request data (e.g. "assignee_id"). The stdlib module handles
+    # them, so it is used as a fallback.
+    try:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+    except orjson.JSONEncodeError:
+        return json.dumps(obj, sort_keys=sort_keys).encode()
+
+# Errors of a query to OPA. The permission is denied if any of them happens.
+_OPA_ERRORS = (
+    pybreaker.CircuitBreakerError, # the breaker is open
+    urllib3.exceptions.HTTPError, # connection problems and timeouts
+    ValueError, # the response isn't valid JSON
+    KeyError, # the response doesn't have a result
+    RuntimeError, # the WebAssembly policy has failed
+)
+
+@_OPA_BREAKER
+def _post_opa_query(url, payload):
+    r = _OPA_POOL.request('POST', url, body=_dump_json(payload),
+        headers={'Content-Type': 'application/json'})
+    return orjson.loads(r.data)['result']
+
+_OPA_WASM_POLICY = None
+_OPA_WASM_FAILED = False
+_OPA_WASM_LOCK = threading.Lock()
+
+def _load_wasm_policy():
+    # Must be called with _OPA_WASM_LOCK held. Returns None if the policy
+    # cannot be loaded. In this case queries are sent to the OPA server.
+    global _OPA_WASM_POLICY, _OPA_WASM_FAILED
+    if _OPA_WASM_POLICY is None and not _OPA_WASM_FAILED:
+        try:
+            from opa_wasm import OPAPolicy
+            _OPA_WASM_POLICY = OPAPolicy(settings.IAM_OPA_WASM_POLICY)
+        except Exception as ex:
+            _OPA_WASM_FAILED = True
+            slogger.glob.warning('Cannot load the WebAssembly policy, OPA server '
+                'will be used instead\n{}'.format(str(ex)))
+
+    return _OPA_WASM_POLICY
+
+def _evaluate_wasm_query(policy, url, payload):
+    # The policy is built with the same entrypoints as URLs of the rules,
+    # e.g. "tasks/allow" (see the build_opa_wasm command)
+    entrypoint = url[len(settings.IAM_OPA_DATA_URL) + 1:]
+    results = policy.evaluate(payload['input'], entrypoint)
+    if not results:
+        # The rule is undefined for the input. OPA server doesn't return
+        # a result in this case, so handle it the same way.
+        raise KeyError('result')
+
+    return results[0]['result']
+
+def _query_opa(url, payload):
+    if settings.IAM_OPA_WASM_ENABLED:
+        # An instance of the policy cannot evaluate queries concurrently
+        with _OPA_WASM_LOCK:
+            policy = _load_wasm_policy()
+            if policy is not None:
+                return _evaluate_wasm_query(policy, url, payload)
+
+    return _post_opa_query(url, payload)
+
+# OPA decisions are pure functions of the query payload, so they can be shared
+# between requests. The key includes the whole payload (the user, their
+# privilege and role, the resource), thus any change in the DB which affects a
+# decision changes the key too. TTL limits how long an outdated decision can
+# live after the policy itself has been changed.
+_OPA_ALLOW_CACHE = TTLCache(maxsize=10000, ttl=30)
+# Compiled Q objects for list views. They are never modified after creation.
+_OPA_FILTER_CACHE = TTLCache(maxsize=1000, ttl=30)
+_OPA_CACHE_LOCK = threading.Lock()
+
+# See rules/batch.rego
+_OPA_BATCH_URL = settings.IAM_OPA_DATA_URL + '/batch/allow'
+
+# Maps a view basename to the permission class which handles requests to
+# the view. It is filled by the register_opa_permission decorator. create()
+# of a registered class is called only for views with these basenames.
+_BASENAME_TO_PERM = {}
+
+def register_opa_permission(*basenames):
+    def decorator(cls):
+        for basename in basenames:
+            _BASENAME_TO_PERM[basename] = cls
+        return cls
+
+    return decorator
+
+# Policies compare numbers of resources with small limits only (e.g.
+# organizations.rego checks that the user doesn't own any organization yet),
+# so it is enough to count up to this value.
+_NUM_RESOURCES_LIMIT = 100
+
+def _get_num_owned_organizations(request):
+    # Several permissions can be checked during one request. Don't repeat
+    # the query for each of them.
+    num_resources = getattr(request, '_num_owned_orgs', None)
+    if num_resources is None:
+        num_resources = Organization.objects.filter(
+            owner_id=request.user.id)[:_NUM_RESOURCES_LIMIT].count()
+        request._num_owned_orgs = num_resources
+
+    return num_resources
+
 class OpenPolicyAgentPermission:
     def __init__(self, request, view, obj):
         self.request = request
         self.view = view
         self.obj = obj
 
-        privilege = self.request.iam_context['privilege']
-        organization = self.request.iam_context['organization']
-        membership = self.request.iam_context['membership']
-        user = self.request.user
-
         self.payload = {
             'input': {
-                'auth': {
+                'auth': self._get_auth_payload(request)
+            }
+        }
+
+    @staticmethod
+    def _get_auth_payload(request):
+        # The auth part is the same for all permissions checked during one
+        # request, so it is built once and shared between them. It must not
+        # be modified.
+        auth = getattr(request, '_opa_auth_payload', None)
+        if auth is None:
+            privilege = request.iam_context['privilege']
+            organization = request.iam_context['organization']
+            membership = request.iam_context['membership']
+            user = request.user
+
+            auth = {
+                'user': {
+                    'id': user.id,
+                    'privilege': getattr(privilege, 'name', None),
+                },
+                'organization': {
+                    'id': organization.id,
+                    'owner': {
+                        'id': getattr(organization.owner, 'id', None),
+                    },
                     'user': {
-                        'id': user.id,
-                        'privilege': getattr(privilege, 'name', None),
+                        'role': getattr(membership, 'role', None)
                     },
-                    'organization': {
-                        'id': organization.id,
-                        'owner': {
-                            'id': getattr(organization.owner, 'id', None),
-                        },
-                        'user': {
-                            'role': getattr(membership, 'role', None)
-                        },
-                    } if organization else None
-                }
+                } if organization else None
             }
-        }
+            request._opa_auth_payload = auth
+
+        return auth
+
+    def _get_cache_key(self, url):
+        return (url, _dump_json(self.payload, sort_keys=True))
+
+    def _get_cached_result(self, key, shared_cache=None):
+        # The same query can be sent several times during one request (e.g.
+        # has_permission and has_object_permission), so results are cached
+        # on the request object.
+        cache = getattr(self.request, '_opa_cache', None)
+        if cache is None:
+            cache = self.request._opa_cache = {}
+
+        result = cache.get(key)
+        if result is None and shared_cache is not None:
+            with _OPA_CACHE_LOCK:
+                result = shared_cache.get(key)
+            if result is not None:
+                cache[key] = result
+
+        return result
+
+    def _set_cached_result(self, key, result, shared_cache=None):
+        self.request._opa_cache[key] = result
+        if shared_cache is not None:
+            with _OPA_CACHE_LOCK:
+                shared_cache[key] = result
+
+    def _query(self, url, shared_cache=None):
+        key = self._get_cache_key(url)
+        result = self._get_cached_result(key, shared_cache)
+        if result is None:
+            result = _query_opa(url, self.payload)
+            self._set_cached_result(key, result, shared_cache)
+
+        return result
+
+    def _is_denied_locally(self):
+        # Policies grant an unknown (null) scope only to admins, so there is
+        # no need to ask OPA for other users.
+        return self.payload['input'].get('scope') is None and \
+            self.payload['input']['auth']['user']['privilege'] != settings.IAM_ADMIN_ROLE
 
     def __bool__(self):
-        r = requests.post(self.url, json=self.payload)
-        return r.json()['result']
+        if self._is_denied_locally():
+            return False
 
-    def filter(self, queryset):
-        url = self.url.replace('/allow', '/filter')
-        r = requests.post(url, json=self.payload)
+        try:
+            return self._query(self.url, _OPA_ALLOW_CACHE)
+        except _OPA_ERRORS:
+            return False
+
+    @classmethod
+    def evaluate_all(cls, permissions):
+        # Check all permissions which aren't cached yet with one OPA request
+        queries = []
+        for perm in permissions:
+            if perm._is_denied_locally():
+                return False
+
+            key = perm._get_cache_key(perm.url)
+            result = perm._get_cached_result(key, _OPA_ALLOW_CACHE)
+            if result is None:
+                queries.append((perm, key))
+            elif not result:
+                return False
+
+        if not queries:
+            return True
+        elif len(queries) == 1:
+            return bool(queries[0][0])
+
+        try:
+            results = _query_opa(_OPA_BATCH_URL, {
+                'input': {
+                    'queries': [{
+                        'rule': perm.url[len(settings.IAM_OPA_DATA_URL) + 1:],
+                        'input': perm.payload['input']
+                    } for perm, _ in queries]
+                }
+            })
+        except _OPA_ERRORS:
+            return False
+
+        # A query for an unknown rule doesn't get a result
+        if len(results) != len(queries):
+            return False
+
+        for (perm, key), result in zip(queries, results):
+            perm._set_cached_result(key, result, _OPA_ALLOW_CACHE)
+
+        return all(results)
+
+    @staticmethod
+    def _compile_filter(tokens):
+        # OPA returns the filter in reverse Polish notation
         qobjects = []
-        ops_dict = {
-            '|': operator.or_,
-            '&': operator.and_,
-            '~': operator.not_,
-        }
-        for item in r.json()['result']:
-            if isinstance(item, str):
-                val1 = qobjects.pop()
-                if item == '~':
-                    qobjects.append(ops_dict[item](val1))
-                else:
-                    val2 = qobjects.pop()
-                    qobjects.append(ops_dict[item](val1, val2))
+        pop = qobjects.pop
+        push = qobjects.append
+        for token in tokens:
+            if isinstance(token, dict):
+                push(Q(**token))
+            elif token == '|':
+                push(pop() | pop())
+            elif token == '&':
+                push(pop() & pop())
+            elif token == '~':
+                push(~pop())
             else:
-                qobjects.append(Q(**item))
+                raise ValueError('Unknown operator in the OPA filter: {}'.format(token))
 
         if qobjects:
             assert len(qobjects) == 1
-        else:
-            qobjects.append(Q())
+            return qobjects[0]
+
+        return Q()
+
+    def filter(self, queryset):
+        url = self.url.replace('/allow', '/filter')
+        key = self._get_cache_key(url)
+        qobject = self._get_cached_result(key, _OPA_FILTER_CACHE)
+        if qobject is None:
+            try:
+                tokens = _query_opa(url, self.payload)
+            except _OPA_ERRORS:
+                raise PermissionDenied('The access policy service is unavailable.')
+            qobject = self._compile_filter(tokens)
+            self._set_cached_result(key, qobject, _OPA_FILTER_CACHE)
 
         # By default, a QuerySet will not eliminate duplicate rows. If your
         # query spans multiple tables (e.g. members__user_id, owner_id), it’s
         # possible to get duplicate results when a QuerySet is evaluated.
         # That’s when you’d use distinct().
-        return queryset.filter(qobjects[0]).distinct()
+        return queryset.filter(qobject).distinct()
 
+@register_opa_permission('organization')
 class OrganizationPermission(OpenPolicyAgentPermission):
     @classmethod
     def create(cls, request, view, obj):
-        permissions = []
-        if view.basename == 'organization':
-            self = cls(request, view, obj)
-            permissions.append(self)
-
-        return permissions
+        yield cls(request, view, obj)
 
     def __init__(self, request, view, obj=None):
         super().__init__(request, view, obj)
@@ -106,18 +343,31 @@ class OrganizationPermission(OpenPolicyAgentPermission):
             'retrieve': 'view'
         }.get(self.view.action, None)
 
+    @staticmethod
+    def _get_role(request, org_id):
+        # The permission can be checked twice during one request (see
+        # PolicyEnforcer), so remember roles on the request.
+        roles = getattr(request, '_org_roles', None)
+        if roles is None:
+            roles = request._org_roles = {}
+
+        if org_id not in roles:
+            roles[org_id] = Membership.objects.filter(organization_id=org_id,
+                user_id=request.user.id).values_list('role', flat=True).first()
+
+        return roles[org_id]
+
     @property
     def resource(self):
         user = self.request.user
         if self.obj:
-            membership = Membership.objects.filter(organization=self.obj, user=user).first()
             return {
                 'id': self.obj.id,
                 'owner': {
-                    'id': getattr(self.obj.owner, 'id', None)
+                    'id': self.obj.owner_id
                 },
                 'user': {
-                    'role': membership.role if membership else None
+                    'role': self._get_role(self.request, self.obj.id)
                 }
             }
         elif self.view.action == 'create':
@@ -127,23 +377,18 @@ class OrganizationPermission(OpenPolicyAgentPermission):
                     'id': user.id
                 },
                 'user': {
-                    'num_resources': Organization.objects.filter(
-                        owner_id=user.id).count(),
+                    'num_resources': _get_num_owned_organizations(self.request),
                     'role': 'owner'
                 }
             }
         else:
             return None
 
+@register_opa_permission('invitation')
 class InvitationPermission(OpenPolicyAgentPermission):
     @classmethod
     def create(cls, request, view, obj):
-        permissions = []
-        if view.basename == 'invitation':
-            self = cls(request, view, obj)
-            permissions.append(self)
-
-        return permissions
+        yield cls(request, view, obj)
 
     def __init__(self, request, view, obj=None):
         super().__init__(request, view, obj)
@@ -175,7 +420,7 @@ class InvitationPermission(OpenPolicyAgentPermission):
                 }
             }
         elif self.view.action == 'create':
-            organization = self.request.iam_context['organization']
+            organization = self.payload['input']['auth']['organization']
             data = {
                 'owner': { 'id': self.request.user.id },
                 'invitee': {
@@ -183,21 +428,17 @@ class InvitationPermission(OpenPolicyAgentPermission):
                 },
                 'role': self.request.data.get('role'),
                 'organization': {
-                    'id': organization.id
+                    'id': organization['id']
                 } if organization else None
             }
 
         return data
 
+@register_opa_permission('membership')
 class MembershipPermission(OpenPolicyAgentPermission):
     @classmethod
     def create(cls, request, view, obj):
-        permissions = []
-        if view.basename == 'membership':
-            self = cls(request, view, obj)
-            permissions.append(self)
-
-        return permissions
+        yield cls(request, view, obj)
 
     def __init__(self, request, view, obj=None):
         super().__init__(request, view, obj)
@@ -226,15 +467,11 @@ class MembershipPermission(OpenPolicyAgentPermission):
         else:
             return None
 
+@register_opa_permission('server')
 class ServerPermission(OpenPolicyAgentPermission):
     @classmethod
     def create(cls, request, view, obj):
-        permissions = []
-        if view.basename == 'server':
-            self = cls(request, view, obj)
-            permissions.append(self)
-
-        return permissions
+        yield cls(request, view, obj)
 
     def __init__(self, request, view, obj):
         super().__init__(request, view, obj)
@@ -252,15 +489,11 @@ class ServerPermission(OpenPolicyAgentPermission):
             'share': 'list:content'
         }.get(self.view.action, None)
 
+@register_opa_permission('user')
 class UserPermission(OpenPolicyAgentPermission):
     @classmethod
     def create(cls, request, view, obj):
-        permissions = []
-        if view.basename == 'user':
-            self = cls(request, view, obj)
-            permissions.append(self)
-
-        return permissions
+        yield cls(request, view, obj)
 
     @classmethod
     def create_view(cls, user_id, request):
@@ -307,20 +540,15 @@ class UserPermission(OpenPolicyAgentPermission):
 
         return data
 
+@register_opa_permission('function', 'request')
 class LambdaPermission(OpenPolicyAgentPermission):
     @classmethod
     def create(cls, request, view, obj):
-        permissions = []
-        if view.basename == 'function' or view.basename == 'request':
-            self = cls(request, view, obj)
-            permissions.append(self)
-
-            task_id = request.data.get('task')
-            if task_id:
-                perm = TaskPermission.create_view_data(request, task_id)
-                permissions.append(perm)
+        yield cls(request, view, obj)
 
-        return permissions
+        task_id = request.data.get('task')
+        if task_id:
+            yield TaskPermission.create_view_data(request, task_id)
 
     def __init__(self, request, view, obj):
         super().__init__(request, view, obj)
@@ -339,15 +567,11 @@ class LambdaPermission(OpenPolicyAgentPermission):
             ('request', 'destroy'): 'call:offline',
         }.get((self.view.basename, self.view.action), None)
 
+@register_opa_permission('cloudstorage')
 class CloudStoragePermission(OpenPolicyAgentPermission):
     @classmethod
     def create(cls, request, view, obj):
-        permissions = []
-        if view.basename == 'cloudstorage':
-            self = cls(request, view, obj)
-            permissions.append(self)
-
-        return permissions
+        yield cls(request, view, obj)
 
     def __init__(self, request, view, obj=None):
         super().__init__(request, view, obj)
@@ -373,15 +597,14 @@ class CloudStoragePermission(OpenPolicyAgentPermission):
         data = None
         if self.view.action == 'create':
             user_id = self.request.user.id
-            organization = self.request.iam_context['organization']
+            organization = self.payload['input']['auth']['organization']
             data = {
                 'owner': { 'id': user_id },
                 'organization': {
-                    'id': organization.id
+                    'id': organization['id']
                 } if organization else None,
                 'user': {
-                    'num_resources': Organization.objects.filter(
-                        owner=user_id).count()
+                    'num_resources': _get_num_owned_organizations(self.request)
                 }
             }
         elif self.obj:
@@ -395,30 +618,23 @@ class CloudStoragePermission(OpenPolicyAgentPermission):
 
         return data
 
+@register_opa_permission('project')
 class ProjectPermission(OpenPolicyAgentPermission):
     @classmethod
     def create(cls, request, view, obj):
-        permissions = []
-        if view.basename == 'project':
-            for scope in cls.get_scopes(request, view, obj):
-                self = cls(scope, request, view, obj)
-                permissions.append(self)
-
-            if view.action == 'tasks':
-                perm = TaskPermission.create_list(request)
-                permissions.append(perm)
+        for scope in cls.get_scopes(request, view, obj):
+            yield cls(scope, request, view, obj)
 
-            owner = request.data.get('owner_id') or request.data.get('owner')
-            if owner:
-                perm = UserPermission.create_view(owner, request)
-                permissions.append(perm)
+        if view.action == 'tasks':
+            yield TaskPermission.create_list(request)
 
-            assignee = request.data.get('assignee_id') or request.data.get('assignee')
-            if assignee:
-                perm = UserPermission.create_view(assignee, request)
-                permissions.append(perm)
+        owner = request.data.get('owner_id') or request.data.get('owner')
+        if owner:
+            yield UserPermission.create_view(owner, request)
 
-        return permissions
+        assignee = request.data.get('assignee_id') or request.data.get('assignee')
+        if assignee:
+            yield UserPermission.create_view(assignee, request)
 
     @classmethod
     def create_view(cls, request, project_id):
@@ -484,7 +700,7 @@ class ProjectPermission(OpenPolicyAgentPermission):
                 }
             }
         elif self.view.action in ['create', 'import_backup']:
-            organization = self.request.iam_context['organization']
+            organization = self.payload['input']['auth']['organization']
             data = {
                 "id": None,
                 "owner": { "id": self.request.user.id },
@@ -492,7 +708,7 @@ class ProjectPermission(OpenPolicyAgentPermission):
                     "id": self.request.data.get('assignee_id')
                 },
                 'organization': {
-                    "id": organization.id if organization else None
+                    "id": organization['id'] if organization else None
                 },
                 "user": {
                     "num_resources": Project.objects.filter(
@@ -502,35 +718,27 @@ class ProjectPermission(OpenPolicyAgentPermission):
 
         return data
 
+@register_opa_permission('task')
 class TaskPermission(OpenPolicyAgentPermission):
     @classmethod
     def create(cls, request, view, obj):
-        permissions = []
-        if view.basename == 'task':
-            for scope in cls.get_scopes(request, view, obj):
-                self = cls(scope, request, view, obj)
-                permissions.append(self)
-
-            if view.action == 'jobs':
-                perm = JobPermission.create_list(request)
-                permissions.append(perm)
-
-            owner = request.data.get('owner_id') or request.data.get('owner')
-            if owner:
-                perm = UserPermission.create_view(owner, request)
-                permissions.append(perm)
-
-            assignee = request.data.get('assignee_id') or request.data.get('assignee')
-            if assignee:
-                perm = UserPermission.create_view(assignee, request)
-                permissions.append(perm)
+        for scope in cls.get_scopes(request, view, obj):
+            yield cls(scope, request, view, obj)
 
-            project_id = request.data.get('project_id') or request.data.get('project')
-            if project_id:
-                perm = ProjectPermission.create_view(request, project_id)
-                permissions.append(perm)
+        if view.action == 'jobs':
+            yield JobPermission.create_list(request)
+
+        owner = request.data.get('owner_id') or request.data.get('owner')
+        if owner:
+            yield UserPermission.create_view(owner, request)
 
-        return permissions
+        assignee = request.data.get('assignee_id') or request.data.get('assignee')
+        if assignee:
+            yield UserPermission.create_view(assignee, request)
+
+        project_id = request.data.get('project_id') or request.data.get('project')
+        if project_id:
+            yield ProjectPermission.create_view(request, project_id)
 
 
     @classmethod
@@ -573,7 +781,7 @@ class TaskPermission(OpenPolicyAgentPermission):
                 } if self.obj.project else None
             }
         elif self.view.action in ['create', 'import_backup']:
-            organization = self.request.iam_context['organization']
+            organization = self.payload['input']['auth']['organization']
             project_id = self.request.data.get('project_id') or self.request.data.get('project')
             project = None
             if project_id:
@@ -590,7 +798,7 @@ class TaskPermission(OpenPolicyAgentPermission):
                         self.request.data.get('assignee')
                 },
                 'organization': {
-                    "id": organization.id if organization else None
+                    "id": organization['id'] if organization else None
                 },
                 "project": {
                     "owner": { "id": getattr(project.owner, 'id', None) },
@@ -670,25 +878,19 @@ class TaskPermission(OpenPolicyAgentPermission):
 
         return scopes
 
+@register_opa_permission('job')
 class JobPermission(OpenPolicyAgentPermission):
     @classmethod
     def create(cls, request, view, obj):
-        permissions = []
-        if view.basename == 'job':
-            for scope in cls.get_scopes(request, view, obj):
-                self = cls(scope, request, view, obj)
-                permissions.append(self)
-
-            if view.action == 'issues':
-                perm = IssuePermission.create_list(request)
-                permissions.append(perm)
+        for scope in cls.get_scopes(request, view, obj):
+            yield cls(scope, request, view, obj)
 
-            assignee = request.data.get('assignee')
-            if assignee:
-                perm = UserPermission.create_view(assignee, request)
-                permissions.append(perm)
+        if view.action == 'issues':
+            yield IssuePermission.create_list(request)
 
-        return permissions
+        assignee = request.data.get('assignee')
+        if assignee:
+            yield UserPermission.create_view(assignee, request)
 
     @classmethod
     def create_list(cls, request):
@@ -779,15 +981,11 @@ class JobPermission(OpenPolicyAgentPermission):
         return scopes
 
 
+@register_opa_permission('comment')
 class CommentPermission(OpenPolicyAgentPermission):
     @classmethod
     def create(cls, request, view, obj):
-        permissions = []
-        if view.basename == 'comment':
-            self = cls(request, view, obj)
-            permissions.append(self)
-
-        return permissions
+        yield cls(request, view, obj)
 
     @classmethod
     def create_list(cls, request):
@@ -862,20 +1060,15 @@ class CommentPermission(OpenPolicyAgentPermission):
 
         return data
 
+@register_opa_permission('issue')
 class IssuePermission(OpenPolicyAgentPermission):
     @classmethod
     def create(cls, request, view, obj):
-        permissions = []
-        if view.basename == 'issue':
-            self = cls(request, view, obj)
-            permissions.append(self)
-
-            assignee = request.data.get('assignee')
-            if assignee:
-                perm = UserPermission.create_view(assignee, request)
-                permissions.append(perm)
+        yield cls(request, view, obj)
 
-        return permissions
+        assignee = request.data.get('assignee')
+        if assignee:
+            yield UserPermission.create_view(assignee, request)
 
     @classmethod
     def create_list(cls, request):
@@ -952,11 +1145,14 @@ class IssuePermission(OpenPolicyAgentPermission):
 class PolicyEnforcer(BasePermission):
     # pylint: disable=no-self-use
     def check_permission(self, request, view, obj):
-        permissions = []
-        for perm in OpenPolicyAgentPermission.__subclasses__():
-            permissions.extend(perm.create(request, view, obj))
+        perm = _BASENAME_TO_PERM.get(view.basename)
+        if perm:
+            # create() yields permissions lazily. Thus, if a permission is
+            # denied by a cached decision, the next ones aren't even created.
+            return OpenPolicyAgentPermission.evaluate_all(
+                perm.create(request, view, obj))
 
-        return all(permissions)
+        return True
 
     def has_permission(self, request, view):
         if not view.detail:
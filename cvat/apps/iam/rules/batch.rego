@@ -0,0 +1,89 @@
+package batch
+import data.cloudstorages
+import data.comments
+import data.invitations
+import data.issues
+import data.jobs
+import data.lambda
+import data.memberships
+import data.organizations
+import data.projects
+import data.server
+import data.tasks
+import data.users
+
+# Evaluates several "allow" rules in one query.
+# input: {
+#     "queries": [
+#         {
+#             "rule": <"cloudstorages/allow"|"tasks/allow"|...>,
+#             "input": <input of the rule>
+#         },
+#         ...
+#     ]
+# }
+#
+# The result contains a decision per query in the same order. A query for an
+# unknown rule doesn't have a decision.
+
+evaluate(query) = result {
+    query.rule == "cloudstorages/allow"
+    result := cloudstorages.allow with input as query.input
+}
+
+evaluate(query) = result {
+    query.rule == "comments/allow"
+    result := comments.allow with input as query.input
+}
+
+evaluate(query) = result {
+    query.rule == "invitations/allow"
+    result := invitations.allow with input as query.input
+}
+
+evaluate(query) = result {
+    query.rule == "issues/allow"
+    result := issues.allow with input as query.input
+}
+
+evaluate(query) = result {
+    query.rule == "jobs/allow"
+    result := jobs.allow with input as query.input
+}
+
+evaluate(query) = result {
+    query.rule == "lambda/allow"
+    result := lambda.allow with input as query.input
+}
+
+evaluate(query) = result {
+    query.rule == "memberships/allow"
+    result := memberships.allow with input as query.input
+}
+
+evaluate(query) = result {
+    query.rule == "organizations/allow"
+    result := organizations.allow with input as query.input
+}
+
+evaluate(query) = result {
+    query.rule == "projects/allow"
+    result := projects.allow with input as query.input
+}
+
+evaluate(query) = result {
+    query.rule == "server/allow"
+    result := server.allow with input as query.input
+}
+
+evaluate(query) = result {
+    query.rule == "tasks/allow"
+    result := tasks.allow with input as query.input
+}
+
+evaluate(query) = result {
+    query.rule == "users/allow"
+    result := users.allow with input as query.input
+}
+
+allow := [result | query := input.queries[_]; result := evaluate(query)]
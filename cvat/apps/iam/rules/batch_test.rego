@@ -0,0 +1,18 @@
+package batch
+
+test_results_are_in_order_of_queries {
+    allow == [true, false] with input as {"queries": [{"rule": "organizations/allow", "input": {"scope": "create", "auth": {"user": {"id": 1, "privilege": "user"}, "organization": null}, "resource": {"user": {"num_resources": 0, "role": "owner"}, "owner": {"id": 1}}}}, {"rule": "organizations/allow", "input": {"scope": "create", "auth": {"user": {"id": 1, "privilege": "user"}, "organization": null}, "resource": {"user": {"num_resources": 1, "role": "owner"}, "owner": {"id": 1}}}}]}
+    allow == [false, true] with input as {"queries": [{"rule": "organizations/allow", "input": {"scope": "create", "auth": {"user": {"id": 1, "privilege": "user"}, "organization": null}, "resource": {"user": {"num_resources": 1, "role": "owner"}, "owner": {"id": 1}}}}, {"rule": "organizations/allow", "input": {"scope": "create", "auth": {"user": {"id": 1, "privilege": "user"}, "organization": null}, "resource": {"user": {"num_resources": 0, "role": "owner"}, "owner": {"id": 1}}}}]}
+}
+
+test_mixed_decisions_of_different_rules {
+    allow == [true, false, true, false] with input as {"queries": [{"rule": "server/allow", "input": {"scope": "view", "auth": {"user": {"id": 2, "privilege": null}, "organization": null}}}, {"rule": "server/allow", "input": {"scope": "list:content", "auth": {"user": {"id": 2, "privilege": null}, "organization": null}}}, {"rule": "organizations/allow", "input": {"scope": "create", "auth": {"user": {"id": 2, "privilege": "admin"}, "organization": null}, "resource": {"user": {"num_resources": 10, "role": "owner"}, "owner": {"id": 2}}}}, {"rule": "organizations/allow", "input": {"scope": "create", "auth": {"user": {"id": 2, "privilege": "worker"}, "organization": null}, "resource": {"user": {"num_resources": 0, "role": "owner"}, "owner": {"id": 2}}}}]}
+}
+
+test_unknown_rule_has_no_decision {
+    allow == [true] with input as {"queries": [{"rule": "unknown/allow", "input": {"scope": "view", "auth": {"user": {"id": 3, "privilege": "admin"}, "organization": null}}}, {"rule": "server/allow", "input": {"scope": "view", "auth": {"user": {"id": 3, "privilege": "admin"}, "organization": null}}}]}
+}
+
+test_no_queries {
+    allow == [] with input as {"queries": []}
+}
@@ -0,0 +1,285 @@
+# Copyright (C) 2022 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+from collections import namedtuple
+import json
+from types import SimpleNamespace
+from unittest import mock
+
+from django.conf import settings
+from django.db.models import Q
+from django.test import SimpleTestCase, override_settings
+from rest_framework.exceptions import PermissionDenied
+from urllib3.exceptions import MaxRetryError
+
+from cvat.apps.iam import permissions
+from cvat.apps.iam.permissions import OpenPolicyAgentPermission, ServerPermission
+
+View = namedtuple('View', ['action'])
+
+def create_request(privilege=None, organization=None, membership=None):
+    return SimpleNamespace(user=SimpleNamespace(id=1), data={},
+        iam_context={'privilege': privilege, 'organization': organization,
+            'membership': membership})
+
+class OpenPolicyAgentTestCase(SimpleTestCase):
+    def setUp(self):
+        permissions._OPA_ALLOW_CACHE.clear()
+        permissions._OPA_FILTER_CACHE.clear()
+        permissions._OPA_BREAKER.close()
+        self.request = create_request()
+
+    def _create_permission(self, action='about'):
+        return ServerPermission(self.request, View(action), None)
+
+class EvaluateAllTest(OpenPolicyAgentTestCase):
+    def test_cached_deny_stops_evaluation(self):
+        perm = self._create_permission()
+        permissions._OPA_ALLOW_CACHE[perm._get_cache_key(perm.url)] = False
+
+        def create_permissions():
+            yield perm
+            self.fail('The next permission must not be created')
+
+        with mock.patch.object(permissions, '_post_opa_query') as post:
+            self.assertFalse(OpenPolicyAgentPermission.evaluate_all(
+                create_permissions()))
+            post.assert_not_called()
+
+    def test_single_query_is_sent_to_its_rule(self):
+        perm = self._create_permission()
+
+        with mock.patch.object(permissions, '_post_opa_query',
+                return_value=True) as post:
+            self.assertTrue(OpenPolicyAgentPermission.evaluate_all([perm]))
+            post.assert_called_once_with(perm.url, perm.payload)
+
+    def test_several_queries_are_sent_in_batch(self):
+        perms = [self._create_permission('about'), self._create_permission('logs')]
+
+        with mock.patch.object(permissions, '_post_opa_query',
+                return_value=[True, False]) as post:
+            self.assertFalse(OpenPolicyAgentPermission.evaluate_all(perms))
+
+        post.assert_called_once()
+        url, payload = post.call_args[0]
+        self.assertEqual(url, permissions._OPA_BATCH_URL)
+        self.assertEqual(payload['input']['queries'], [
+            { 'rule': 'server/allow', 'input': perm.payload['input'] }
+            for perm in perms
+        ])
+        self.assertEqual([permissions._OPA_ALLOW_CACHE.get(
+            perm._get_cache_key(perm.url)) for perm in perms], [True, False])
+
+    def test_missing_batch_decision_denies(self):
+        perms = [self._create_permission('about'), self._create_permission('logs')]
+
+        with mock.patch.object(permissions, '_post_opa_query',
+                return_value=[True]):
+            self.assertFalse(OpenPolicyAgentPermission.evaluate_all(perms))
+
+        self.assertEqual(len(permissions._OPA_ALLOW_CACHE), 0)
+
+class RequestCacheTest(OpenPolicyAgentTestCase):
+    def test_allow_is_queried_once_per_request(self):
+        with mock.patch.object(permissions, '_post_opa_query',
+                return_value=True) as post:
+            # e.g. has_permission and then has_object_permission
+            self.assertTrue(self._create_permission())
+            permissions._OPA_ALLOW_CACHE.clear()
+            self.assertTrue(self._create_permission())
+
+        post.assert_called_once()
+
+    def test_filter_is_queried_once_per_request(self):
+        queryset = mock.Mock()
+        with mock.patch.object(permissions, '_post_opa_query',
+                return_value=[{'owner_id': 1}]) as post:
+            self._create_permission().filter(queryset)
+            permissions._OPA_FILTER_CACHE.clear()
+            self._create_permission().filter(queryset)
+
+        post.assert_called_once()
+        first_q, second_q = [c[0][0] for c in queryset.filter.call_args_list]
+        self.assertIs(first_q, second_q)
+        self.assertEqual(first_q, Q(owner_id=1))
+
+class SharedCacheTest(OpenPolicyAgentTestCase):
+    def _create_org_permission(self, role):
+        request = create_request(
+            organization=SimpleNamespace(id=1, owner=SimpleNamespace(id=2)),
+            membership=SimpleNamespace(role=role))
+        return ServerPermission(request, View('about'), None)
+
+    def test_decision_is_shared_between_requests(self):
+        with mock.patch.object(permissions, '_post_opa_query',
+                return_value=True) as post:
+            self.assertTrue(self._create_permission())
+            self.request = create_request()
+            self.assertTrue(self._create_permission())
+
+        post.assert_called_once()
+
+    def test_role_change_makes_new_query(self):
+        with mock.patch.object(permissions, '_post_opa_query',
+                side_effect=[True, False]) as post:
+            self.assertTrue(self._create_org_permission('maintainer'))
+            self.assertFalse(self._create_org_permission('worker'))
+
+        self.assertEqual(post.call_count, 2)
+
+    def test_owner_change_makes_new_query(self):
+        perms = []
+        for owner_id in (1, 2):
+            self.request = create_request()
+            perm = self._create_permission()
+            perm.payload['input']['resource'] = { 'owner': { 'id': owner_id } }
+            perms.append(perm)
+
+        with mock.patch.object(permissions, '_post_opa_query',
+                side_effect=[True, False]) as post:
+            self.assertTrue(perms[0])
+            self.assertFalse(perms[1])
+
+        self.assertEqual(post.call_count, 2)
+
+    def test_failed_query_is_not_cached(self):
+        with mock.patch.object(permissions, '_post_opa_query',
+                side_effect=[MaxRetryError(None, permissions._OPA_BATCH_URL), True]) as post:
+            self.assertFalse(self._create_permission())
+            self.assertTrue(self._create_permission())
+
+        self.assertEqual(post.call_count, 2)
+
+class UnknownScopeTest(OpenPolicyAgentTestCase):
+    def test_unknown_action_is_denied_without_query(self):
+        with mock.patch.object(permissions, '_post_opa_query') as post:
+            self.assertFalse(self._create_permission('unknown'))
+            self.assertFalse(OpenPolicyAgentPermission.evaluate_all(
+                [self._create_permission('about'), self._create_permission('unknown')]))
+
+        post.assert_not_called()
+
+    def test_unknown_action_of_admin_is_sent_to_opa(self):
+        self.request = create_request(
+            privilege=SimpleNamespace(name=settings.IAM_ADMIN_ROLE))
+        perm = self._create_permission('unknown')
+
+        with mock.patch.object(permissions, '_post_opa_query',
+                return_value=True) as post:
+            self.assertTrue(perm)
+            self.assertTrue(OpenPolicyAgentPermission.evaluate_all([perm]))
+
+        post.assert_called_once_with(perm.url, perm.payload)
+
+class PayloadSerializationTest(OpenPolicyAgentTestCase):
+    def test_integers_out_of_64_bit_range(self):
+        perm = self._create_permission()
+        perm.payload['input']['resource'] = { 'assignee': { 'id': 10 ** 20 } }
+
+        with mock.patch.object(permissions._OPA_POOL, 'request',
+                return_value=SimpleNamespace(data=b'{"result": true}')) as request:
+            self.assertTrue(perm)
+
+        body = request.call_args[1]['body']
+        self.assertEqual(json.loads(body), perm.payload)
+
+class CompileFilterTest(SimpleTestCase):
+    def test_not(self):
+        self.assertEqual(OpenPolicyAgentPermission._compile_filter(
+            [{'owner_id': 1}, '~']), ~Q(owner_id=1))
+
+    def test_or(self):
+        self.assertEqual(OpenPolicyAgentPermission._compile_filter(
+            [{'owner_id': 1}, {'assignee_id': 1}, '|']),
+            Q(assignee_id=1) | Q(owner_id=1))
+
+    def test_empty(self):
+        self.assertEqual(OpenPolicyAgentPermission._compile_filter([]), Q())
+
+    def test_unknown_operator(self):
+        with self.assertRaises(ValueError):
+            OpenPolicyAgentPermission._compile_filter([{'owner_id': 1}, '!'])
+
+class OpenPolicyAgentFailureTest(OpenPolicyAgentTestCase):
+    def _fail_requests(self):
+        return mock.patch.object(permissions._OPA_POOL, 'request',
+            side_effect=MaxRetryError(None, permissions._OPA_BATCH_URL))
+
+    def test_timeouts_bound_queries(self):
+        pool_kw = permissions._OPA_POOL.connection_pool_kw
+        self.assertEqual(pool_kw['timeout'].connect_timeout, settings.IAM_OPA_TIMEOUT[0])
+        self.assertEqual(pool_kw['timeout'].read_timeout, settings.IAM_OPA_TIMEOUT[1])
+        self.assertFalse(pool_kw['retries'].read)
+
+    def test_errors_deny_permissions(self):
+        perm = self._create_permission('about')
+
+        with self._fail_requests():
+            self.assertFalse(perm)
+            self.assertFalse(OpenPolicyAgentPermission.evaluate_all(
+                [perm, self._create_permission('logs')]))
+            with self.assertRaises(PermissionDenied):
+                perm.filter(None)
+
+    def test_invalid_response_denies_permission(self):
+        perm = self._create_permission()
+
+        with mock.patch.object(permissions._OPA_POOL, 'request',
+                return_value=SimpleNamespace(data=b'Bad Gateway')):
+            self.assertFalse(perm)
+
+    def test_breaker_stops_queries(self):
+        perm = self._create_permission()
+
+        with self._fail_requests() as request:
+            for _ in range(settings.IAM_OPA_BREAKER_FAIL_MAX + 1):
+                self.assertFalse(perm)
+
+        self.assertEqual(request.call_count, settings.IAM_OPA_BREAKER_FAIL_MAX)
+
+@override_settings(IAM_OPA_WASM_ENABLED=True)
+class WasmPolicyTest(OpenPolicyAgentTestCase):
+    def test_query_is_evaluated_in_process(self):
+        perm = self._create_permission()
+        policy = mock.Mock()
+        policy.evaluate.return_value = [{ 'result': True }]
+
+        with mock.patch.object(permissions, '_OPA_WASM_POLICY', policy), \
+                mock.patch.object(permissions, '_post_opa_query') as post:
+            self.assertTrue(perm)
+            post.assert_not_called()
+
+        policy.evaluate.assert_called_once_with(perm.payload['input'], 'server/allow')
+
+    def test_undefined_result_denies(self):
+        perm = self._create_permission()
+        policy = mock.Mock()
+        policy.evaluate.return_value = []
+
+        with mock.patch.object(permissions, '_OPA_WASM_POLICY', policy):
+            self.assertFalse(perm)
+            with self.assertRaises(PermissionDenied):
+                perm.filter(None)
+
+    def test_policy_error_denies(self):
+        perm = self._create_permission()
+        policy = mock.Mock()
+        policy.evaluate.side_effect = RuntimeError('unreachable')
+
+        with mock.patch.object(permissions, '_OPA_WASM_POLICY', policy):
+            self.assertFalse(perm)
+            with self.assertRaises(PermissionDenied):
+                perm.filter(None)
+
+    @override_settings(IAM_OPA_WASM_POLICY='/nonexistent/policy.wasm')
+    def test_fallback_to_opa_server(self):
+        perm = self._create_permission()
+
+        with mock.patch.object(permissions, '_OPA_WASM_POLICY', None), \
+                mock.patch.object(permissions, '_OPA_WASM_FAILED', False), \
+                mock.patch.object(permissions, '_post_opa_query',
+                    return_value=True) as post:
+            self.assertTrue(perm)
+            post.assert_called_once_with(perm.url, perm.payload)
@@ -239,6 +239,17 @@ IAM_ADMIN_ROLE = 'admin'
 # Index in the list below corresponds to the priority (0 has highest priority)
 IAM_ROLES = [IAM_ADMIN_ROLE, 'business', 'user', 'worker']
 IAM_OPA_DATA_URL = 'http://opa:8181/v1/data'
+# Connect and read timeouts (in seconds) for requests to OPA
+IAM_OPA_TIMEOUT = (0.2, 1.0)
+# Deny all OPA queries for IAM_OPA_BREAKER_RESET_TIMEOUT seconds after
+# IAM_OPA_BREAKER_FAIL_MAX failed requests in a row
+IAM_OPA_BREAKER_FAIL_MAX = 5
+IAM_OPA_BREAKER_RESET_TIMEOUT = 10
+# Evaluate policies in-process using their WebAssembly build instead of
+# sending requests to OPA. It requires requirements/iam_wasm.txt and the
+# policy built by the build_opa_wasm command (see IAM_OPA_WASM_POLICY). If the
+# policy cannot be loaded, requests are sent to OPA as usual.
+IAM_OPA_WASM_ENABLED = False
 LOGIN_URL = 'rest_login'
 LOGIN_REDIRECT_URL = '/'
 
@@ -366,6 +377,8 @@ if not os.path.exists(LOGSTASH_DB):
 MEDIA_DATA_ROOT = os.path.join(DATA_ROOT, 'data')
 os.makedirs(MEDIA_DATA_ROOT, exist_ok=True)
 
+IAM_OPA_WASM_POLICY = os.path.join(DATA_ROOT, 'iam', 'policy.wasm')
+
 CACHE_ROOT = os.path.join(DATA_ROOT, 'cache')
 os.makedirs(CACHE_ROOT, exist_ok=True)
 